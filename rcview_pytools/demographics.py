@@ -1,16 +1,33 @@
 """Tools for summarizing demographic information."""
 
+import numpy
 from arcgis.features import Feature
 from arcgis.features import FeatureLayer
 from arcgis.geometry.filters import intersects
 from arcgis.features.analysis import enrich_layer
 from .geometry import Polygon
 from shapely.validation import explain_validity
-from .extras import round_significant
+from shapely.strtree import STRtree
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from .extras import round_significant, _round_sig2
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 from tqdm import tqdm
 from .extras import RCActivityIndicator as RCSpinner
 
 
+# parsed census block polygons keyed on GEOID, shared across calls; the
+# TIGER block set is stable within a session and successive runs commonly
+# cover overlapping extents
+_block_cache = {}
+
+# single-entry STRtree cache keyed on the GEOID tuple of the fetched block
+# set, so repeat runs over the same extent skip the O(M log M) tree build
+_block_tree_cache = {}
+
+
 def _population_housing_enrich(areas_layer, areas_query, areas_sr, enrich_id):
     if enrich_id is None:
         raise ValueError('A feature layer item ID must be specified for the enrich_id argument.')
@@ -29,12 +46,18 @@ def _population_housing_enrich(areas_layer, areas_query, areas_sr, enrich_id):
     enrich_item = gis.content.get(enrich_id)
     enrich_layer = enrich_item.layers[0]
     del_results = enrich_layer.delete_features(where='1=1')
-    enrich_features = [
+    # stream the add payload in chunks so large area sets neither spike
+    # memory nor exceed the server's per-request edit limit
+    enrich_features = (
         {'geometry': {'rings': f.geometry['rings'],
                       'spatialReference': areas.spatial_reference},
          'attributes': {'origin_obj': f.get_value(objectid)}}
-        for f in areas.features]
-    add_results = enrich_layer.edit_features(adds=enrich_features)
+        for f in areas.features)
+    add_results = []
+    chunk = list(islice(enrich_features, 500))
+    while chunk:
+        add_results += enrich_layer.edit_features(adds=chunk)['addResults']
+        chunk = list(islice(enrich_features, 500))
 
     # enrich with current population and housing
     enrich_fc = enrich_layer(enrich_layer, country='US',
@@ -44,34 +67,103 @@ def _population_housing_enrich(areas_layer, areas_query, areas_sr, enrich_id):
 
     # update area features
     spinner.text = 'Updating areas'
-    areas_updates = []
-    areas_summary = {}
-
-    for i, f in enrich_df.iterrows():
-        areas_updates.append(
-            {'attributes': {
-                    objectid: f.origin_obj,
-                    'population': round_significant(f.TOTPOP_CY),
-                    'housing': round_significant(f.TOTHH_CY),
-                    'method': 'Esri enrichment'
-                }
+    oids = enrich_df.origin_obj.to_numpy()
+    pops = enrich_df.TOTPOP_CY.to_numpy()
+    hus = enrich_df.TOTHH_CY.to_numpy()
+    pops_rounded = round_significant(pops)
+    hus_rounded = round_significant(hus)
+
+    areas_updates = [
+        {'attributes': {
+                objectid: int(oid),
+                'population': pop_rounded,
+                'housing': hu_rounded,
+                'method': 'Esri enrichment'
             }
-        )
-
-        areas_summary[f.origin_obj] = {
-            'hu_enrich': f.TOTHH_CY,
-            'pop_enrich': f.TOTPOP_CY,
         }
+        for oid, pop_rounded, hu_rounded
+        in zip(oids, pops_rounded, hus_rounded)]
 
-    update_results = areas_layer.edit_features(updates=areas_updates)
+    areas_summary = {
+        oid: {'hu_enrich': hu, 'pop_enrich': pop}
+        for oid, pop, hu in zip(oids, pops, hus)}
 
+    update_results = []
+    for start in range(0, len(areas_updates), 500):
+        update_results += areas_layer.edit_features(
+            updates=areas_updates[start:start + 500])['updateResults']
+
+    results_by_oid = {x['objectId']: x for x in update_results}
     for k, v in areas_summary.items():
-        v['update_results'] = [x for x in update_results['updateResults'] if x['objectId'] == int(k)]
+        result = results_by_oid.get(int(k))
+        v['update_results'] = [result] if result else []
 
     spinner.succeed('Finished updating areas')
     return areas_summary
 
 
+def _area_block_summary(area_poly, area_warning, block_tree, block_order,
+                        block_polys, block_areas, block_pop, block_hu,
+                        block_geoid, block_invalid):
+    # Summarize census block population and housing counts for a single area.
+    # Pure geometry and numpy work, so it is safe to run from worker threads;
+    # returns the summary dictionary plus any processing errors and warnings.
+    processing_errors = []
+    processing_warnings = [] if area_warning is None else [area_warning]
+
+    # find candidate blocks whose envelope intersects the area envelope
+    candidates = sorted(block_order[id(p)]
+                        for p in block_tree.query(area_poly))
+
+    # compute the proportion of each candidate block within the area
+    area_prep = prep(area_poly)
+    int_props = numpy.zeros(len(candidates))
+    usable = numpy.ones(len(candidates), dtype=bool)
+    for k, j in enumerate(candidates):
+        block_poly = block_polys[j]
+        if j in block_invalid:
+            processing_warnings.append(block_invalid[j])
+            usable[k] = False
+            continue
+
+        # fully-contained and disjoint blocks resolve without computing
+        # the full intersection
+        if area_prep.contains_properly(block_poly):
+            int_props[k] = 1.0
+            continue
+        if not area_prep.intersects(block_poly):
+            continue
+
+        try:
+            intersection = block_poly.intersection(area_poly)
+        except Exception as e:
+            processing_errors.append(
+                'Unable to intersect census block {} ({}).'\
+                .format(block_geoid[j], e))
+            usable[k] = False
+            continue
+
+        int_props[k] = intersection.area / block_areas[j]
+
+    # summarize population and housing units
+    cand_pop = block_pop[candidates][usable]
+    cand_hu = block_hu[candidates][usable]
+    int_props = int_props[usable]
+    gt50 = int_props > 0.5
+
+    summary = {
+        'no_blocks_all': len(candidates),
+        'no_blocks_gt50': int(gt50.sum()),
+        'pop_all': int(cand_pop.sum()),
+        'pop_gt50': int(cand_pop[gt50].sum()),
+        'pop_wtd': int(numpy.round(cand_pop * int_props).sum()),
+        'hu_all': int(cand_hu.sum()),
+        'hu_gt50': int(cand_hu[gt50].sum()),
+        'hu_wtd': int(numpy.round(cand_hu * int_props).sum())
+    }
+    return summary, processing_errors, processing_warnings
+
+
 def population_housing(areas_layer, areas_query='population is null',
                        method='gt50', enrich_id=None):
     """Calculates and updates population and housing units within areas.
@@ -121,107 +213,137 @@ def population_housing(areas_layer, areas_query='population is null',
         out_fields=objectid + ',population,housing,method',
         out_sr=areas_sr)
 
-    spinner.text = 'Summarizing population and housing'
+    # nothing to do when the query matches no areas (the default query
+    # matches none after a successful update); the envelope union below
+    # requires at least one geometry
+    if len(areas) == 0:
+        spinner.succeed('No areas matched the query')
+        return {}
+
+    spinner.text = 'Retrieving census blocks'
     census_layer = FeatureLayer(url='https://tigerweb.geo.census.gov/arcgis/rest/services/TIGERweb/Tracts_Blocks/MapServer/12')
+
+    # query census blocks intersecting all areas with a single REST call,
+    # rather than one round-trip per area
+    area_polys = [s.as_shapely2() for s in areas.sdf.SHAPE]
+    areas_envelope = unary_union([p.envelope for p in area_polys]).envelope
+    blocks_filter = intersects(areas_envelope.as_arcgis({'wkid': areas_sr}),
+                               sr=areas_sr)
+    # centimeter precision is ample for web-mercator block outlines and
+    # substantially shrinks the JSON payload
+    census_blocks = census_layer.query(
+        out_fields='OBJECTID,POP100,HU100,GEOID',
+        geometry_filter=blocks_filter, out_sr=areas_sr,
+        geometry_precision=2)
+
+    # pull block attributes into flat arrays once, so the per-area summaries
+    # are accumulated with numpy instead of per-row pandas access
+    block_pop = census_blocks.sdf.POP100.to_numpy()
+    block_hu = census_blocks.sdf.HU100.to_numpy()
+    block_geoid = census_blocks.sdf.GEOID.to_numpy()
+
+    # parse block geometries, reusing polygons cached from earlier calls
+    block_polys = []
+    for geoid, shape in zip(block_geoid, census_blocks.sdf.SHAPE):
+        poly = _block_cache.get(geoid)
+        if poly is None:
+            poly = shape.as_shapely2()
+            _block_cache[geoid] = poly
+        block_polys.append(poly)
+
+    # index block polygons with an STRtree for fast per-area candidate
+    # lookups, reusing the previous tree when the block set is unchanged
+    tree_key = tuple(block_geoid)
+    if tree_key in _block_tree_cache:
+        block_tree, block_order = _block_tree_cache[tree_key]
+    else:
+        block_tree = STRtree(block_polys)
+        block_order = {id(p): j for j, p in enumerate(block_polys)}
+        _block_tree_cache.clear()
+        _block_tree_cache[tree_key] = (block_tree, block_order)
+    block_areas = numpy.array([p.area for p in block_polys])
+
+    # validate block polygons once; validity checks are expensive and the
+    # same block is often examined by several overlapping areas
+    block_invalid = {
+        j: 'Unable to convert census block {} to valid polygon ({}).'\
+           .format(block_geoid[j], explain_validity(p))
+        for j, p in enumerate(block_polys) if not p.is_valid
+    }
+
+    spinner.text = 'Summarizing population and housing'
     areas_summary = {}
+    areas_updates = []
     processing_issues = False
     spinner.stop_and_persist()
     #print('  Summarizing population and housing', flush=True)
-    for i, area in tqdm(areas.sdf.iterrows(), total=len(areas)):
-        processing_errors = []
-        processing_warnings = []
-        # query census blocks intersecting area
-        area_poly = area.SHAPE.as_shapely2()
-        if not area_poly.is_valid:
-            processing_warnings.append(
-                'Unable to convert area to valid polygon ({}).'\
-                    .format(explain_validity(area_poly))
-            )
-
-        area_bbox = area_poly.envelope.as_arcgis({'wkid': areas_sr})
-        area_filter = intersects(area_bbox, sr=areas_sr)
-        census_blocks = census_layer.query(
-            out_fields='OBJECTID,POP100,HU100,GEOID',
-            geometry_filter=area_filter, out_sr=areas_sr)
-
-        # summarize population and housing units
-        pop_all = 0
-        pop_gt50 = 0
-        blocks_gt50 = 0
-        pop_wtd = 0
-        hu_all = 0
-        hu_gt50 = 0
-        hu_wtd = 0
-
-        for j, block in census_blocks.sdf.iterrows():
-            block_poly = block.SHAPE.as_shapely2()
-            if not block_poly.is_valid:
-                processing_warnings.append(
-                    'Unable to convert census block {} to valid polygon ({}).'\
-                    .format(block.GEOID, explain_validity(block_poly)))
-                continue
-
-            try:
-                intersection = block_poly.intersection(area_poly)
-            except Exception as e:
-                processing_errors.append(
-                    'Unable to intersect census block {} ({}).'\
-                    .format(block.GEOID, e))
-                continue
-
-            int_prop = intersection.area / block_poly.area
-
-            pop = block.POP100
-            pop_all += pop
-            pop_gt50 += pop * (int_prop > 0.5)
-            pop_wtd += round(pop * int_prop)
-
-            hu = block.HU100
-            hu_all += hu
-            hu_gt50 += hu * (int_prop > 0.5)
-            hu_wtd += round(hu * int_prop)
-
-            blocks_gt50 += int_prop > 0.5
-
-        areas_summary[area[objectid]] = {
-            'no_blocks_all': len(census_blocks),
-            'no_blocks_gt50': blocks_gt50,
-            'pop_all': pop_all,
-            'pop_gt50': pop_gt50,
-            'pop_wtd': pop_wtd,
-            'hu_all': hu_all,
-            'hu_gt50': hu_gt50,
-            'hu_wtd': hu_wtd
-        }
+
+    # summarize areas concurrently; the per-area work is GEOS- and
+    # numpy-bound, so threads overlap nicely while the GIL is released
+    summarize = partial(_area_block_summary, block_tree=block_tree,
+                        block_order=block_order, block_polys=block_polys,
+                        block_areas=block_areas, block_pop=block_pop,
+                        block_hu=block_hu, block_geoid=block_geoid,
+                        block_invalid=block_invalid)
+    # validate areas in bulk up front; explain_validity only runs for the
+    # rare invalid polygon, keeping it off the summary hot path
+    area_warnings = [
+        None if p.is_valid else
+        'Unable to convert area to valid polygon ({}).'\
+            .format(explain_validity(p))
+        for p in area_polys]
+
+    # shapely 1.x builds the underlying GEOS tree lazily on the first query
+    # and that build is not thread-safe, so prime it before the workers
+    # share the tree
+    block_tree.query(area_polys[0])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        area_summaries = list(tqdm(
+            executor.map(summarize, area_polys, area_warnings),
+            total=len(areas)))
+
+    area_objectids = areas.sdf[objectid].to_numpy()
+    for oid, (summary, processing_errors, processing_warnings) in \
+            zip(area_objectids, area_summaries):
+        areas_summary[oid] = summary
 
         if processing_errors:
             processing_issues = True
-            areas_summary[area[objectid]]['ERRORS'] = processing_errors
+            summary['ERRORS'] = processing_errors
         if processing_warnings:
             processing_issues = True
-            areas_summary[area[objectid]]['WARNINGS'] = processing_warnings
+            summary['WARNINGS'] = processing_warnings
 
         # update area values
         if method == 'all':
-            area.population = round_significant(pop_all)
-            area.housing = round_significant(hu_all)
-            area.method = 'all'
+            population, housing = summary['pop_all'], summary['hu_all']
+            method_name = 'all'
         elif method == 'gt50':
-            area.population = round_significant(pop_gt50)
-            area.housing = round_significant(hu_gt50)
-            area.method = 'greater than 50%'
+            population, housing = summary['pop_gt50'], summary['hu_gt50']
+            method_name = 'greater than 50%'
         elif method == 'wtd':
-            area.population = round_significant(pop_wtd)
-            area.housing = round_significant(hu_wtd)
-            area.method = 'weighted'
+            population, housing = summary['pop_wtd'], summary['hu_wtd']
+            method_name = 'weighted'
         else:
             method = None
 
         if method is not None:
-            area.drop('SHAPE', inplace=True)
-            areas_summary[area[objectid]]['update_results'] = \
-                areas_layer.edit_features(
-                updates=[Feature(attributes=area.to_dict())])['updateResults']
+            areas_updates.append(Feature(attributes={
+                objectid: int(oid),
+                'population': _round_sig2(population),
+                'housing': _round_sig2(housing),
+                'method': method_name
+            }))
+
+    # apply all area updates in chunked batches rather than one REST call
+    # per area (ArcGIS servers limit edits to around 500 features per call)
+    update_results = []
+    for start in range(0, len(areas_updates), 500):
+        update_results += areas_layer.edit_features(
+            updates=areas_updates[start:start + 500])['updateResults']
+    for result in update_results:
+        areas_summary[result['objectId']]['update_results'] = [result]
 
     spinner.succeed('Finished updating areas')
     if processing_issues:
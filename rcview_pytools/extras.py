@@ -1,32 +1,56 @@
 """Various classes and functions for working with GIS data."""
 
 import os
+import math
+import re
 import urllib
 import string
 import mgrs
 import numpy
+from concurrent.futures import ThreadPoolExecutor
 from .constants import OS_WINDOWS, IN_IPYTHON
 from halo import Halo
 from arcgis.gis import Item
-from arcgis.geocoding import geocode
+from arcgis.geocoding import geocode, batch_geocode
 from arcgis.geometry import Point
 from arcgis.gis import User
 from arcgis.features import FeatureLayer
 
 
+def _round_sig2(x):
+    # round_significant specialized for scalars at the default 2-digit
+    # precision; skips the array machinery for hot-loop call sites
+    if x == 0.0:
+        return x
+    elif x < 0:
+        raise ValueError('Value must be positive.')
+    return round(x, 1 - int(math.floor(math.log10(x))))
+
+
 def round_significant(x, p=2):
-    """Round positive numeric value to significant digits.
+    """Round positive numeric values to significant digits.
 
+    Accepts a scalar or an array-like of values; arrays are rounded
+    element-wise in a single vectorized pass.
     Arguments:
-    x  A numeric value.
+    x  A numeric value or array of values.
     p  Significant digits precision.
     """
-    if x == 0.0:
-        return x
-    elif x < 0:
+    if numpy.ndim(x) == 0:
+        # plain math calls avoid numpy's scalar-dispatch overhead
+        if x == 0.0:
+            return x
+        elif x < 0:
+            raise ValueError('Value must be positive.')
+        return round(x, (p - 1) - int(math.floor(math.log10(x))))
+    x = numpy.asarray(x, dtype=float)
+    if numpy.any(x < 0):
         raise ValueError('Value must be positive.')
-    else:
-        return numpy.around(x, -int(numpy.floor(numpy.log10(x))) + (p - 1))
+    rounded = numpy.zeros_like(x)
+    nonzero = x != 0
+    scale = 10.0 ** (p - 1 - numpy.floor(numpy.log10(x[nonzero])))
+    rounded[nonzero] = numpy.around(x[nonzero] * scale) / scale
+    return rounded if rounded.ndim else rounded.item()
 
 
 def fix_fgdb_files(dir):
@@ -37,9 +61,19 @@ def fix_fgdb_files(dir):
     Arguments:
     dir  Directory containing the geodatabase files.
     """
-    os.chdir(dir)
-    for file in os.listdir():
-        os.rename(file, file.split('\\')[1])
+    # scandir iterates lazily and full paths avoid mutating the process-wide
+    # working directory
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            fixed_name = entry.name.split('\\', 1)[-1]
+            if fixed_name != entry.name:
+                os.rename(entry.path, os.path.join(dir, fixed_name))
+
+
+# URL templates using printf-style formatting, which skips str.format's
+# per-call format-spec parsing when generating URLs in bulk
+_GOOGLE_MAPS_URL = 'https://www.google.com/maps/place/%2.5f,%3.5f/@%2.5f,%3.5f,18z'
+_APPLE_MAPS_URL = 'http://maps.apple.com/?ll=%2.5f,%3.5f&q=%s'
 
 
 def google_maps_url(latitude, longitude):
@@ -49,8 +83,7 @@ def google_maps_url(latitude, longitude):
     latitude   Latitude in decimal degrees.
     longitude  Longitude in decimal degrees.
     """
-    return 'https://www.google.com/maps/place/{0:2.5f},{1:3.5f}/@{0:2.5f},{1:3.5f},18z'.\
-        format(latitude, longitude)
+    return _GOOGLE_MAPS_URL % (latitude, longitude, latitude, longitude)
 
 
 def apple_maps_url(latitude, longitude, label='X'):
@@ -61,8 +94,12 @@ def apple_maps_url(latitude, longitude, label='X'):
     longitude  Longitude in decimal degrees.
     label      Text label for map point.
     """
-    return 'http://maps.apple.com/?ll={0:2.5f},{1:3.5f}&q={2:s}'.format(
-        latitude, longitude, urllib.parse.quote(label))
+    return _APPLE_MAPS_URL % (latitude, longitude, urllib.parse.quote(label))
+
+
+# single MGRS converter shared by the grid functions; constructing one per
+# call repeats its C-level setup for every point in bulk conversions
+_MGRS = mgrs.MGRS()
 
 
 def latlon_to_usng(latitude, longitude, precision=4):
@@ -75,17 +112,25 @@ def latlon_to_usng(latitude, longitude, precision=4):
     longitude  Longitude in decimal degrees.
     precision  Grid value precision.
     """
-    m = mgrs.MGRS()
-    usng = m.toMGRS(latitude, longitude, MGRSPrecision=precision).decode('ascii')
-    usng_fmt = []
-    usng_fmt.append(usng[0:3])
-    usng_fmt.append(usng[3:5])
+    usng = _MGRS.toMGRS(latitude, longitude, MGRSPrecision=precision).decode('ascii')
     if precision > 0:
-        gc =  usng[5:]
-        idx_split = int(len(gc) / 2)
-        usng_fmt.append(gc[0:idx_split])
-        usng_fmt.append(gc[idx_split:])
-    return ' '.join(usng_fmt)
+        # grid coordinates contain 'precision' easting then northing digits
+        return f'{usng[0:3]} {usng[3:5]} {usng[5:5 + precision]} {usng[5 + precision:]}'
+    return f'{usng[0:3]} {usng[3:5]}'
+
+
+def latlon_to_usng_batch(latitudes, longitudes, precision=4):
+    """US National Grid values for many point locations.
+
+    Converts coordinate pairs in bulk with the shared converter, returning a
+    list of grid values. See latlon_to_usng for the precision argument.
+    Arguments:
+    latitudes   Latitudes in decimal degrees.
+    longitudes  Longitudes in decimal degrees.
+    precision   Grid value precision.
+    """
+    return [latlon_to_usng(lat, lon, precision)
+            for lat, lon in zip(latitudes, longitudes)]
 
 
 def usng_to_latlon(usng):
@@ -95,8 +140,7 @@ def usng_to_latlon(usng):
     Arguments:
     usng  A US National Grid value.
     """
-    m = mgrs.MGRS()
-    return m.toLatLon(usng.replace(' ', '').encode('ascii'))
+    return _MGRS.toLatLon(usng.replace(' ', '').encode('ascii'))
 
 
 if IN_IPYTHON:
@@ -240,9 +284,21 @@ def _patched_copy_feature_layer_collection(self, service_name, layers=None,
     is_free = content.is_service_name_available(service_name=service_name,
                                                 service_type="Feature Service")
     if is_free == False:
+        # enumerate existing services with one search so candidate suffixes
+        # already taken are skipped locally; each probe below is otherwise a
+        # full REST round-trip
+        try:
+            taken = {item.name for item in
+                     content.search(query='title:%s' % service_name,
+                                    item_type='Feature Service',
+                                    max_items=100)}
+        except Exception:
+            taken = set()
         while is_free == False:
             i += 1
             s = service_name + "_%s" % i
+            if s in taken:
+                continue
             is_free = content.is_service_name_available(service_name=s,
                                                         service_type="Feature Service")
             if is_free:
@@ -293,23 +349,18 @@ def _patched_copy_feature_layer_collection(self, service_name, layers=None,
 
     fs = FeatureLayerCollection(url=copied_item.url, gis=self._gis)
     fs_manager = fs.manager
-    add_defs = {'layers' : [], 'tables' : []}
-    for l in idx_layers:
+    def _definition(l):
         v = dict(l.manager.properties)
         if 'indexes' in v:
             del v['indexes']
         if 'adminLayerInfo' in v:
             del v['adminLayerInfo']
-        add_defs['layers'].append(v)
-        del l
-    for l in idx_tables:
-        v = dict(l.manager.properties)
-        if 'indexes' in v:
-            del v['indexes']
-        if 'adminLayerInfo' in v:
-            del v['adminLayerInfo']
-        add_defs['tables'].append(v)
-        del l
+        return v
+    # each manager.properties access is a REST metadata request, so collect
+    # the layer and table definitions concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        add_defs = {'layers': list(executor.map(_definition, idx_layers)),
+                    'tables': list(executor.map(_definition, idx_tables))}
     res = fs_manager.add_to_definition(json_dict=add_defs)
     if res['success'] ==  True:
         return copied_item
@@ -322,16 +373,18 @@ def _patched_copy_feature_layer_collection(self, service_name, layers=None,
 Item.copy_feature_layer_collection = _patched_copy_feature_layer_collection
 
 
+# translation table and descriptor pattern for _standardize_unit; longer
+# descriptors are listed before their prefixes (e.g. APARTMENT before APT)
+# so the alternation matches them first
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+_UNIT_DESCRIPTORS_RE = re.compile(
+    'APARTMENT|APT|SPACE|SPC|SP|LOT|UNIT|NUMBER|NUM|NO|ROOM|\\s')
+
+
 def _standardize_unit(x):
-    # convert to upper and replace punctuation
-    x = str(x).upper().translate(str.maketrans('', '', string.punctuation))
-    # replace various unit types
-    unit_descriptors = ['APARTMENT', 'APT', 'SPACE', 'SPC', 'SP', 'LOT', 'UNIT', 'NUMBER', 'NUM', 'NO', 'ROOM']
-    for u in unit_descriptors:
-        if u in x:
-            x = x.replace(u, '')
-    # replace any remaining spaces
-    return x.replace(' ', '')
+    # convert to upper, strip punctuation, then remove unit descriptors and
+    # spaces in a single compiled-regex pass
+    return _UNIT_DESCRIPTORS_RE.sub('', str(x).upper().translate(_PUNCTUATION_TABLE))
 
 
 class StandardizedAddress():
@@ -358,7 +411,9 @@ class StandardizedAddress():
         unit     Unit identifier for apartments, trailer park spaces, etc.
         """
         gc = geocode(address, max_locations=1, out_sr={'wkid': 4326})
-        atts = gc[0]['attributes']
+        self._assign(address, gc[0]['attributes'], unit)
+    def _assign(self, address, atts, unit):
+        # set attributes from a geocode result's attribute dictionary
         self.search = address
         self.type = atts['Addr_type']
         self.number = atts['AddNum']
@@ -370,6 +425,33 @@ class StandardizedAddress():
         self.county = atts['Subregion']
         self.latitude = round(atts['Y'], 6)
         self.longitude = round(atts['X'], 6)
+    @classmethod
+    def batch(cls, addresses, units=None, chunk_size=1000):
+        """Creates standardized addresses with batched geocoding.
+
+        Geocodes many addresses with one REST request per chunk rather than
+        one request per address. Returns a list of StandardizedAddress objects
+        in the same order as the addresses argument.
+        Arguments:
+        addresses   List of addresses (do not include any sub-unit
+                    identifiers, such as apartment numbers).
+        units       Optional list of unit identifiers corresponding to each
+                    address.
+        chunk_size  Maximum number of addresses geocoded per request.
+        """
+        if units is None:
+            units = [None] * len(addresses)
+        standardized = []
+        for start in range(0, len(addresses), chunk_size):
+            chunk = addresses[start:start + chunk_size]
+            results = sorted(batch_geocode(chunk, out_sr={'wkid': 4326}),
+                             key=lambda r: r['attributes']['ResultID'])
+            for r in results:
+                i = start + r['attributes']['ResultID']
+                address = cls.__new__(cls)
+                address._assign(addresses[i], r['attributes'], units[i])
+                standardized.append(address)
+        return standardized
     @property
     def address(self):
         """Returns a string containing the address components."""
@@ -15,9 +15,15 @@ from shapely.geometry import Polygon as ShapelyPolygon
 from shapely.geometry import MultiPolygon as ShapelyMultiPolygon
 from shapely.geometry.polygon import LinearRing as ShapelyLinearRing
 from shapely.validation import explain_validity
+try:
+    from shapely.validation import make_valid
+except ImportError:
+    # shapely builds without GEOS 3.8+ lack make_valid
+    make_valid = None
 from arcgis.features import GeoAccessor, GeoSeriesAccessor
 from pandas import DataFrame
 from geopandas import GeoDataFrame
+import numpy
 import warnings
 
 
@@ -40,6 +46,18 @@ def custom_formatwarning(msg, *args, **kwargs):
 warnings.formatwarning = custom_formatwarning
 
 
+def _point_in_ring(x, y, ring_coords):
+    # Vectorized crossing-number test of a point against a ring's coordinate
+    # array. Classifies interior rings without constructing a GEOS polygon
+    # for every candidate pairing.
+    x0, y0 = ring_coords[:-1, 0], ring_coords[:-1, 1]
+    x1, y1 = ring_coords[1:, 0], ring_coords[1:, 1]
+    crossing = (y0 > y) != (y1 > y)
+    x0, y0, x1, y1 = x0[crossing], y0[crossing], x1[crossing], y1[crossing]
+    x_int = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return bool(numpy.count_nonzero(x_int > x) % 2)
+
+
 def as_shapely2(self, fix_self_intersections=True, warn_invalid=True):
     """Return a Shapely [Mulit]Polygon.
 
@@ -51,39 +69,51 @@ def as_shapely2(self, fix_self_intersections=True, warn_invalid=True):
     fix_self_intersections  Fix self-intersecting polygons.
     warn_invalid            Issue a warning if polygon is invalid.
     """
-    # extract exterior and interior rings
-    exterior_rings, interior_rings = [], []
-    for ring in map(ShapelyLinearRing, self.rings):
-        interior_rings.append(ring) if ring.is_ccw else exterior_rings.append(ring)
-
-    # create polygons for each exterior ring
-    polys = []
-    for exterior_ring in exterior_rings:
-        exterior_poly = ShapelyPolygon(exterior_ring)
-        if len(interior_rings) > 0:
-            # determine which interior rings are within the exterior ring
-            within_rings, outside_rings = [], []
-            for interior_ring in interior_rings:
-                within_rings.append(interior_ring)\
-                    if ShapelyPolygon(interior_ring).intersects(exterior_poly)\
-                    else outside_rings.append(interior_ring)
-            polys.append(ShapelyPolygon(exterior_ring, within_rings))
-            interior_rings = outside_rings
-        else:
-            polys.append(exterior_poly)
-
-    if len(polys) == 1:
-        poly_shp = ShapelyPolygon(polys[0])
+    if len(self.rings) == 1:
+        # single-ring polygons (the common case for small features) need no
+        # ring extraction or classification
+        poly_shp = ShapelyPolygon(self.rings[0])
     else:
-        poly_shp = ShapelyMultiPolygon(polys)
+        # extract exterior and interior rings
+        exterior_rings, interior_rings = [], []
+        for ring in map(ShapelyLinearRing, self.rings):
+            interior_rings.append(ring) if ring.is_ccw else exterior_rings.append(ring)
+
+        # assign each interior ring to its containing exterior ring in a
+        # single pass, extracting each exterior's coordinate array only once
+        exterior_coords = [numpy.asarray(r.coords) for r in exterior_rings]
+        exterior_bounds = [r.bounds for r in exterior_rings]
+        holes = [[] for _ in exterior_rings]
+        for interior_ring in interior_rings:
+            x, y = interior_ring.coords[0][:2]
+            for i, coords in enumerate(exterior_coords):
+                # cheap bounding-box rejection before the full crossing test
+                x_min, y_min, x_max, y_max = exterior_bounds[i]
+                if x < x_min or x > x_max or y < y_min or y > y_max:
+                    continue
+                if _point_in_ring(x, y, coords):
+                    holes[i].append(interior_ring)
+                    break
+
+        # create polygons for each exterior ring
+        polys = [ShapelyPolygon(exterior_ring, rings_within)
+                 for exterior_ring, rings_within in zip(exterior_rings, holes)]
+
+        if len(polys) == 1:
+            poly_shp = ShapelyPolygon(polys[0])
+        else:
+            poly_shp = ShapelyMultiPolygon(polys)
 
     # check validity and fix any self-intersecting rings
     if not poly_shp.is_valid:
         invalid_reason = explain_validity(poly_shp)
         invalid_message = 'Polygon is not valid ({})'.format(invalid_reason)
         if 'Self-intersection' in invalid_reason and fix_self_intersections:
-            # fix with buffer trick
-            poly_shp = poly_shp.buffer(0.0)
+            if make_valid is not None:
+                poly_shp = make_valid(poly_shp)
+            else:
+                # fix with buffer trick
+                poly_shp = poly_shp.buffer(0.0)
             invalid_message += '; self-intersections were automatically fixed'
         if warn_invalid:
             invalid_message += '.'
@@ -116,7 +146,9 @@ def as_arcgis(self, spatial_reference):
     elif isinstance(self, ShapelyPolygon):
         linear_rings = [self.exterior]
         linear_rings += self.interiors
-        rings = [list(r.__geo_interface__['coordinates']) for r in linear_rings]
+        # extract each ring's coordinates through the array interface in one
+        # C-level pass instead of building a GeoJSON dict of tuples per ring
+        rings = [numpy.asarray(r.coords).tolist() for r in linear_rings]
         geom = Geometry({'rings': rings, 'spatialReference': spatial_reference})
 
     elif isinstance(self, ShapelyMultiPolygon):
@@ -124,7 +156,7 @@ def as_arcgis(self, spatial_reference):
         for poly in self.geoms:
             linear_rings += [poly.exterior]
             linear_rings += poly.interiors
-        rings = [list(r.__geo_interface__['coordinates']) for r in linear_rings]
+        rings = [numpy.asarray(r.coords).tolist() for r in linear_rings]
         geom = Geometry({'rings': rings, 'spatialReference': spatial_reference})
 
     return geom
@@ -161,10 +193,13 @@ def to_SpatialDataFrame(self, spatial_reference=None, use_as_arcgis=False):
         spatial_reference = {'wkid': spatial_reference}
 
     sdf = DataFrame(data=self.drop(self.geometry.name, axis=1))
+    # iterate the geometry array directly rather than materializing an
+    # intermediate list copy of the column
+    geometries = self.geometry.values
     if use_as_arcgis:
-        sdf['SHAPE'] = [g.as_arcgis(spatial_reference) for g in self.geometry.tolist()]
+        sdf['SHAPE'] = [g.as_arcgis(spatial_reference) for g in geometries]
     else:
-        sdf['SHAPE'] = [Geometry.from_shapely(g, spatial_reference) for g in self.geometry.tolist()]
+        sdf['SHAPE'] = [Geometry.from_shapely(g, spatial_reference) for g in geometries]
     sdf.spatial.set_geometry('SHAPE')
 
     return sdf
@@ -11,6 +11,7 @@ from six.moves.urllib_parse import urlencode
 import copy
 import tempfile
 import requests
+from requests.adapters import HTTPAdapter
 import io
 import pandas as pd
 from selenium import webdriver
@@ -20,10 +21,50 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException
 import keyring
+import atexit
 from .extras import RCActivityIndicator as RCSpinner
 
 print_messages = True
 
+# shared keep-alive session for raw REST calls; pooled connections avoid a
+# fresh TLS handshake per request when queries run concurrently
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# cached Chrome driver, reused across logins; Chromium startup costs far
+# more than clearing the previous session's state
+_chrome_driver = None
+
+
+def _get_chrome_driver(options=None):
+    global _chrome_driver
+    if _chrome_driver is not None:
+        try:
+            # accessing the browser raises if it has already exited
+            _chrome_driver.current_url
+            # delete_all_cookies only affects the current page's domain (the
+            # parked about:blank), so clear every domain's cookies through
+            # the DevTools protocol to drop portal and single-sign-on state
+            _chrome_driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            return _chrome_driver
+        except Exception:
+            _quit_chrome_driver()
+    _chrome_driver = webdriver.Chrome(options=options) if options \
+                     else webdriver.Chrome()
+    return _chrome_driver
+
+
+def _quit_chrome_driver():
+    global _chrome_driver
+    if _chrome_driver is not None:
+        try:
+            _chrome_driver.quit()
+        except Exception:
+            pass
+        _chrome_driver = None
+
+atexit.register(_quit_chrome_driver)
+
 
 class RCViewGIS(GIS):
     """An arcgis GIS object connected to the RC View Portal."""
@@ -204,7 +245,7 @@ class _RCViewConnection(_ArcGISConnection):
         options = Options()
         #options.add_argument('--headless')
         options.add_argument('--log-level=3')
-        driver = webdriver.Chrome(options=options)
+        driver = _get_chrome_driver(options)
         driver.get(codeurl)
 
         delay = 10
@@ -212,7 +253,7 @@ class _RCViewConnection(_ArcGISConnection):
             using_redcross_element = WebDriverWait(driver, delay).\
                 until(EC.presence_of_element_located((By.XPATH, '//*[@id="enterprisePanel"]/div/div')))
         except TimeoutException:
-            driver.quit()
+            _quit_chrome_driver()
             if print_messages:
                 self._spinner.fail('Accessing Red Cross single-sign-on took too much time.')
 
@@ -226,7 +267,7 @@ class _RCViewConnection(_ArcGISConnection):
             signin_element = WebDriverWait(driver, delay).\
                 until(EC.presence_of_element_located((By.XPATH, '/html/body/main/div[4]/div/div/div/div/div/div/div/div[1]/div/div/div/div[6]/button')))
         except TimeoutException:
-            driver.quit()
+            _quit_chrome_driver()
             if print_messages:
                 self._spinner.fail('Accessing Red Cross single-sign-on took too much time.')
 
@@ -238,12 +279,18 @@ class _RCViewConnection(_ArcGISConnection):
             code_element = WebDriverWait(driver, delay).\
                 until(EC.presence_of_element_located((By.ID, 'code')))
         except TimeoutException:
-            driver.quit()
+            _quit_chrome_driver()
             if print_messages:
                 self._spinner.fail('Receiving an authentication code took too much time.')
 
         code = code_element.get_attribute('value')
-        driver.quit()
+        # drop this login's portal and single-sign-on cookies before parking
+        # the browser for reuse, so a later authentication starts clean
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except Exception:
+            pass
+        driver.get('about:blank')
 
         parameters = {
             'client_id': client_id,
@@ -355,7 +402,7 @@ class RCViewGeocoder(Geocoder):
                 columns=['Address', 'City', 'Region', 'Postal'],
                 header=False
             )
-            census_gc = requests.post(
+            census_gc = _session.post(
                 url='https://geocoding.geo.census.gov/geocoder/locations/addressbatch',
                 params={'returntype': 'locations', 'benchmark': 'Public_AR_Current'},
                 files={'addressFile': f}
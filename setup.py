@@ -36,7 +36,7 @@ setup(
         'geopandas',
         'mgrs',
         'selenium',
-        'shapely',
+        'shapely<2',
         'tqdm',
         'halo'
     ],